@@ -19,14 +19,23 @@ How to run:
 
 Open http://127.0.0.1:5000/ in your browser.
 """
-from flask import Flask, render_template_string, request, redirect, url_for, send_file, jsonify, flash
+from flask import Flask, render_template, render_template_string, request, redirect, url_for, send_file, jsonify, flash, g, abort, session
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, text, event, insert
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex
 from io import StringIO
-from flask import Response
+from flask import Response, stream_with_context
 import csv
 import os
+import hashlib
+import heapq
 import datetime
+import atexit
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
 from flask import send_file
 from flask import render_template_string
 
@@ -50,6 +59,13 @@ class Product(db.Model):
     stock = db.Column(db.Integer, nullable=False, default=0)
     reorder_threshold = db.Column(db.Integer, nullable=False, default=5)
 
+    __table_args__ = (
+        # Covers the low-stock page (id comes free as the rowid)
+        db.Index('ix_product_low_cov', 'stock', 'reorder_threshold', 'sku', 'name'),
+        # Serves the name-ordered product list without a sort step
+        db.Index('ix_product_name_cov', 'name', 'sku', 'stock', 'price', 'reorder_threshold'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -61,23 +77,96 @@ class Product(db.Model):
             "reorder_threshold": self.reorder_threshold
         }
 
+class Meta(db.Model):
+    """Small key/value store for app bookkeeping (e.g. the last CSV export digest)."""
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.String(200))
+
+# Meta row bumped on every commit; shared by all processes and survives restarts
+DATA_VERSION_KEY = "data_version"
+
 # ----------------------
 # DB init + sample data
 # ----------------------
+def set_sqlite_pragmas(dbapi_conn, connection_record):
+    # WAL lets readers (e.g. CSV export) run while a writer commits
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def optimize_on_close(dbapi_conn, connection_record):
+    # Lets SQLite refresh planner stats for tables this connection queried;
+    # the pool rarely closes connections, so init_db disposes the engine at exit
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA optimize")
+    cursor.close()
+
+def index_names():
+    return {row[0] for row in db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+
 def init_db():
+    # Register before create_all so the first pooled connection gets the pragmas too
+    event.listen(db.engine, 'connect', set_sqlite_pragmas)
+    event.listen(db.engine, 'close', optimize_on_close)
+    atexit.register(db.engine.dispose)
     db.create_all()
+    indexes_before = index_names()
+    # Superseded by ix_product_low_cov, which the planner picks for the low-stock page
+    db.session.execute(text("DROP INDEX IF EXISTS ix_product_low"))
+    db.session.execute(text("DROP INDEX IF EXISTS ix_product_low_expr"))
+    # create_all skips tables that already exist, so add any new indexes explicitly
+    for index in Product.__table__.indexes:
+        db.session.execute(CreateIndex(index, if_not_exists=True))
+    db.session.execute(text("INSERT OR IGNORE INTO meta (key, value) VALUES (:key, '0')"),
+                       {"key": DATA_VERSION_KEY})
+    db.session.commit()
     if Product.query.count() == 0:
         sample = [
-            Product(sku="DBR-001", name="Espresso Beans 250g", description="Dark roast", price=250.0, stock=20, reorder_threshold=5),
-            Product(sku="DBR-002", name="Milk (1L)", description="Fresh milk", price=80.0, stock=10, reorder_threshold=3),
-            Product(sku="DBR-003", name="Cup (12oz)", description="Disposable cup", price=2.5, stock=200, reorder_threshold=50),
+            {"sku": "DBR-001", "name": "Espresso Beans 250g", "description": "Dark roast", "price": 250.0, "stock": 20, "reorder_threshold": 5},
+            {"sku": "DBR-002", "name": "Milk (1L)", "description": "Fresh milk", "price": 80.0, "stock": 10, "reorder_threshold": 3},
+            {"sku": "DBR-003", "name": "Cup (12oz)", "description": "Disposable cup", "price": 2.5, "stock": 200, "reorder_threshold": 50},
         ]
-        db.session.bulk_save_objects(sample)
+        db.session.execute(insert(Product), sample)
         db.session.commit()
+    # Gather index statistics so the planner actually picks the indexes above; a full
+    # ANALYZE is only needed on a fresh database or when the set of indexes changed
+    stats_missing = (
+        db.session.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")).first() is None
+        or db.session.execute(text("SELECT 1 FROM sqlite_stat1")).first() is None
+    )
+    if stats_missing or index_names() != indexes_before:
+        db.session.execute(text("ANALYZE"))
+    else:
+        db.session.execute(text("PRAGMA optimize"))
+    db.session.commit()
 
 with app.app_context():
     init_db()
 
+# ----------------------
+# Helpers
+# ----------------------
+_URL_SENTINEL = 987654321
+
+
+@app.template_global()
+def product_url(endpoint, product_id):
+    """Same as url_for(endpoint, product_id=...), but only routes each endpoint once per request."""
+    patterns = g.setdefault('product_url_patterns', {})
+    if endpoint not in patterns:
+        patterns[endpoint] = url_for(endpoint, product_id=_URL_SENTINEL).split(str(_URL_SENTINEL), 1)
+    prefix, suffix = patterns[endpoint]
+    return f"{prefix}{product_id}{suffix}"
+
+@event.listens_for(db.session, 'before_commit')
+def bump_data_version(session):
+    # Part of the committing transaction, so edits the totals can't see (e.g. renames) still invalidate caches
+    session.execute(text("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = :key"),
+                    {"key": DATA_VERSION_KEY})
+
 # ----------------------
 # Templates
 # ----------------------
@@ -112,50 +201,216 @@ BASE_HTML = """
           {% endfor %}
         {% endif %}
       {% endwith %}
-      {{ body|safe }}
+      {% block content %}{% endblock %}
     </div>
   </body>
 </html>
 """
 
+DASHBOARD_HTML = """
+{% extends layout %}
+{% block content %}
+<div class="row mb-4">
+  <div class="col-md-4"><div class="card p-3"><h5>Total product types</h5><h2>{{ product_count }}</h2></div></div>
+  <div class="col-md-4"><div class="card p-3"><h5>Total items</h5><h2>{{ total_items }}</h2></div></div>
+  <div class="col-md-4"><div class="card p-3"><h5>Inventory value</h5><h2>₱{{ '{:,.2f}'.format(total_value) }}</h2></div></div>
+</div>
+<div class="mb-3 d-flex justify-content-between align-items-center">
+  <h4>Recent products</h4>
+  <a class="btn btn-primary" href="{{ url_for('add_product') }}">Add product</a>
+</div>
+<table class="table table-striped">
+  <thead><tr><th>SKU</th><th>Name</th><th>Stock</th><th>Price</th><th>Threshold</th><th>Actions</th></tr></thead>
+  <tbody>
+  {% for p in products %}
+    <tr><td>{{ p.sku }}</td><td>{{ p.name }}</td><td>{{ p.stock }}</td><td>₱{{ '{:,.2f}'.format(p.price) }}</td><td>{{ p.reorder_threshold }}</td>
+    <td><a class="btn btn-sm btn-outline-secondary" href="{{ product_url('edit_product', p.id) }}">Edit</a>
+    <a class="btn btn-sm btn-outline-danger" href="{{ product_url('delete_product', p.id) }}">Delete</a>
+    <a class="btn btn-sm btn-outline-success" href="{{ product_url('adjust_stock', p.id) }}">Adjust Stock</a></td></tr>
+  {% endfor %}
+  </tbody>
+</table>
+<div class="mt-4">
+  <a href="{{ url_for('low_stock') }}" class="btn btn-warning">View low-stock items ({{ low_count }})</a>
+  <a href="{{ url_for('export_csv') }}" class="btn btn-outline-primary">Export CSV</a>
+</div>
+{% endblock %}
+"""
+
+PRODUCTS_HTML = """
+{% extends layout %}
+{% block content %}
+<div class="d-flex justify-content-between mb-3">
+  <h3>Products</h3>
+  <div>
+    <a class="btn btn-primary" href="{{ url_for('add_product') }}">Add product</a>
+    <a class="btn btn-outline-secondary" href="{{ url_for('index') }}">Back</a>
+  </div>
+</div>
+<table class="table table-hover">
+  <thead><tr><th>SKU</th><th>Name</th><th>Description</th><th>Stock</th><th>Price</th><th>Threshold</th><th>Actions</th></tr></thead>
+  <tbody>
+  {% for p in products %}
+    <tr>
+        <td>{{ p.sku }}</td>
+        <td>{{ p.name }}</td>
+        <td>{{ p.description or '' }}</td>
+        <td>{{ p.stock }}</td>
+        <td>₱{{ '{:,.2f}'.format(p.price) }}</td>
+        <td>{{ p.reorder_threshold }}</td>
+        <td>
+          <a class="btn btn-sm btn-secondary" href="{{ product_url('edit_product', p.id) }}">Edit</a>
+          <a class="btn btn-sm btn-danger" href="{{ product_url('delete_product', p.id) }}">Delete</a>
+          <a class="btn btn-sm btn-success" href="{{ product_url('adjust_stock', p.id) }}">Adjust Stock</a>
+        </td>
+    </tr>
+  {% endfor %}
+  </tbody>
+</table>
+{% endblock %}
+"""
+
+ADD_PRODUCT_HTML = """
+{% extends layout %}
+{% block content %}
+<h3>Add Product</h3>
+<form method="post">
+  <div class="mb-3"><label class="form-label">SKU</label><input class="form-control" name="sku" required></div>
+  <div class="mb-3"><label class="form-label">Name</label><input class="form-control" name="name" required></div>
+  <div class="mb-3"><label class="form-label">Description</label><textarea class="form-control" name="description"></textarea></div>
+  <div class="row">
+    <div class="col"><label class="form-label">Price</label><input class="form-control" name="price" type="number" step="0.01" value="0.00" required></div>
+    <div class="col"><label class="form-label">Stock</label><input class="form-control" name="stock" type="number" value="0" required></div>
+    <div class="col"><label class="form-label">Reorder threshold</label><input class="form-control" name="reorder_threshold" type="number" value="5" required></div>
+  </div>
+  <div class="mt-3"><button class="btn btn-success" type="submit">Save</button><a class="btn btn-secondary" href="{{ url_for('list_products') }}">Cancel</a></div>
+</form>
+{% endblock %}
+"""
+
+EDIT_PRODUCT_HTML = """
+{% extends layout %}
+{% block content %}
+<h3>Edit Product</h3>
+<form method="post">
+  <div class="mb-3"><label class="form-label">SKU</label><input class="form-control" name="sku" value="{{ p.sku }}" required></div>
+  <div class="mb-3"><label class="form-label">Name</label><input class="form-control" name="name" value="{{ p.name }}" required></div>
+  <div class="mb-3"><label class="form-label">Description</label><textarea class="form-control" name="description">{{ p.description or '' }}</textarea></div>
+  <div class="row">
+    <div class="col"><label class="form-label">Price</label><input class="form-control" name="price" type="number" step="0.01" value="{{ p.price }}" required></div>
+    <div class="col"><label class="form-label">Stock</label><input class="form-control" name="stock" type="number" value="{{ p.stock }}" required></div>
+    <div class="col"><label class="form-label">Reorder threshold</label><input class="form-control" name="reorder_threshold" type="number" value="{{ p.reorder_threshold }}" required></div>
+  </div>
+  <div class="mt-3"><button class="btn btn-success" type="submit">Save</button><a class="btn btn-secondary" href="{{ url_for('list_products') }}">Cancel</a></div>
+</form>
+{% endblock %}
+"""
+
+ADJUST_STOCK_HTML = """
+{% extends layout %}
+{% block content %}
+<h3>Adjust Stock for {{ p.name }} ({{ p.sku }})</h3>
+<form method="post">
+  <div class="mb-3"><label class="form-label">Current stock: <strong>{{ p.stock }}</strong></label></div>
+  <div class="mb-3"><label class="form-label">Adjust by (negative to subtract)</label><input class="form-control" name="adjust" type="number" value="0" required></div>
+  <div class="mb-3"><label class="form-label">Reason</label><input class="form-control" name="reason"></div>
+  <div><button class="btn btn-success" type="submit">Apply</button><a class="btn btn-secondary" href="{{ url_for('list_products') }}">Cancel</a></div>
+</form>
+{% endblock %}
+"""
+
+LOW_STOCK_HTML = """
+{% extends layout %}
+{% block content %}
+<div class="d-flex justify-content-between mb-3">
+  <h3>Low-stock items</h3><a class="btn btn-outline-primary" href="{{ url_for('index') }}">Back</a>
+</div>
+<table class="table table-bordered">
+  <thead><tr><th>SKU</th><th>Name</th><th>Stock</th><th>Threshold</th><th>Actions</th></tr></thead>
+  <tbody>
+  {% for p in items %}
+    <tr>
+      <td>{{ p.sku }}</td>
+      <td>{{ p.name }}</td>
+      <td>{{ p.stock }}</td>
+      <td>{{ p.reorder_threshold }}</td>
+      <td>
+        <a class="btn btn-sm btn-success" href="{{ product_url('adjust_stock', p.id) }}">Adjust</a>
+        <a class="btn btn-sm btn-secondary" href="{{ product_url('edit_product', p.id) }}">Edit</a>
+      </td>
+    </tr>
+  {% else %}
+    <tr><td colspan='5'>No low-stock items</td></tr>
+  {% endfor %}
+  </tbody>
+</table>
+{% endblock %}
+"""
+
+# Compile once at import instead of on every request; pages extend the shared layout
+app.jinja_env.globals['layout'] = app.jinja_env.from_string(BASE_HTML)
+DASHBOARD_TEMPLATE = app.jinja_env.from_string(DASHBOARD_HTML)
+PRODUCTS_TEMPLATE = app.jinja_env.from_string(PRODUCTS_HTML)
+ADD_PRODUCT_TEMPLATE = app.jinja_env.from_string(ADD_PRODUCT_HTML)
+EDIT_PRODUCT_TEMPLATE = app.jinja_env.from_string(EDIT_PRODUCT_HTML)
+ADJUST_STOCK_TEMPLATE = app.jinja_env.from_string(ADJUST_STOCK_HTML)
+LOW_STOCK_TEMPLATE = app.jinja_env.from_string(LOW_STOCK_HTML)
+
 # ----------------------
 # Routes
 # ----------------------
+DASHBOARD_TOTALS_QUERY = text("""
+    SELECT COUNT(*) AS product_count,
+           IFNULL(MAX(id), 0) AS max_id,
+           IFNULL(SUM(stock), 0) AS total_items,
+           TOTAL(stock * price) AS total_value,
+           IFNULL(SUM(stock <= reorder_threshold), 0) AS low_count,
+           (SELECT value FROM meta WHERE key = :version_key) AS data_version
+    FROM product
+""").bindparams(version_key=DATA_VERSION_KEY)
+RECENT_PRODUCTS_QUERY = text("""
+    SELECT id, sku, name, stock, price, reorder_threshold
+    FROM product
+    ORDER BY id DESC
+    LIMIT 20
+""")
+DASHBOARD_CACHE_SIZE = 8
+dashboard_cache = OrderedDict()  # etag -> rendered HTML
+dashboard_cache_lock = threading.Lock()  # the dev server handles requests in threads
+
 @app.route('/')
 def index():
-    products = Product.query.all()
-    total_items = sum(p.stock for p in products)
-    total_value = sum(p.stock * p.price for p in products)
-    low_count = Product.query.filter(Product.stock <= Product.reorder_threshold).count()
-    body = f"""
-    <div class="row mb-4">
-      <div class="col-md-4"><div class="card p-3"><h5>Total product types</h5><h2>{len(products)}</h2></div></div>
-      <div class="col-md-4"><div class="card p-3"><h5>Total items</h5><h2>{total_items}</h2></div></div>
-      <div class="col-md-4"><div class="card p-3"><h5>Inventory value</h5><h2>₱{total_value:,.2f}</h2></div></div>
-    </div>
-    <div class="mb-3 d-flex justify-content-between align-items-center">
-      <h4>Recent products</h4>
-      <a class="btn btn-primary" href="{url_for('add_product')}">Add product</a>
-    </div>
-    <table class="table table-striped">
-      <thead><tr><th>SKU</th><th>Name</th><th>Stock</th><th>Price</th><th>Threshold</th><th>Actions</th></tr></thead>
-      <tbody>
-        {''.join(['''<tr><td>{sku}</td><td>{name}</td><td>{stock}</td><td>₱{price:,.2f}</td><td>{th}</td>
-        <td><a class="btn btn-sm btn-outline-secondary" href="{edit}">Edit</a>
-        <a class="btn btn-sm btn-outline-danger" href="{delete}">Delete</a>
-        <a class="btn btn-sm btn-outline-success" href="{adjust}">Adjust Stock</a></td></tr>'''.format(
-            sku=p.sku, name=p.name, stock=p.stock, price=p.price, th=p.reorder_threshold,
-            edit=url_for('edit_product', product_id=p.id),
-            delete=url_for('delete_product', product_id=p.id),
-            adjust=url_for('adjust_stock', product_id=p.id)) for p in products])}
-      </tbody>
-    </table>
-    <div class="mt-4">
-      <a href="{url_for('low_stock')}" class="btn btn-warning">View low-stock items ({low_count})</a>
-      <a href="{url_for('export_csv')}" class="btn btn-outline-primary">Export CSV</a>
-    </div>
-    """
-    return render_template_string(BASE_HTML, body=body)
+    # The totals double as the cache version token, so a cache hit costs one aggregate query
+    totals = db.session.execute(DASHBOARD_TOTALS_QUERY).one()
+    # Pending flash messages are part of the page, so only cache when there are none
+    cacheable = '_flashes' not in session
+    if cacheable:
+        version = ':'.join(map(str, totals))
+        etag = hashlib.blake2b(version.encode("utf-8"), digest_size=16).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            with dashboard_cache_lock:
+                html = dashboard_cache.get(etag)
+                if html is not None:
+                    dashboard_cache.move_to_end(etag)
+            if html is None:
+                html = render_dashboard(totals)
+                with dashboard_cache_lock:
+                    dashboard_cache[etag] = html
+                    if len(dashboard_cache) > DASHBOARD_CACHE_SIZE:
+                        dashboard_cache.popitem(last=False)
+            response = Response(html)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    return render_dashboard(totals)
+
+def render_dashboard(totals):
+    products = db.session.execute(RECENT_PRODUCTS_QUERY).all()
+    return render_template(DASHBOARD_TEMPLATE, products=products, product_count=totals.product_count,
+                           total_items=totals.total_items, total_value=totals.total_value,
+                           low_count=totals.low_count)
 
 # ----------------------
 # Product CRUD
@@ -163,35 +418,7 @@ def index():
 @app.route('/products')
 def list_products():
     products = Product.query.order_by(Product.name).all()
-    rows = "".join([f"""
-        <tr>
-            <td>{p.sku}</td>
-            <td>{p.name}</td>
-            <td>{p.description or ''}</td>
-            <td>{p.stock}</td>
-            <td>₱{p.price:,.2f}</td>
-            <td>{p.reorder_threshold}</td>
-            <td>
-              <a class="btn btn-sm btn-secondary" href="{url_for('edit_product', product_id=p.id)}">Edit</a>
-              <a class="btn btn-sm btn-danger" href="{url_for('delete_product', product_id=p.id)}">Delete</a>
-              <a class="btn btn-sm btn-success" href="{url_for('adjust_stock', product_id=p.id)}">Adjust Stock</a>
-            </td>
-        </tr>
-        """ for p in products])
-    body = f"""
-    <div class="d-flex justify-content-between mb-3">
-      <h3>Products</h3>
-      <div>
-        <a class="btn btn-primary" href="{url_for('add_product')}">Add product</a>
-        <a class="btn btn-outline-secondary" href="{url_for('index')}">Back</a>
-      </div>
-    </div>
-    <table class="table table-hover">
-      <thead><tr><th>SKU</th><th>Name</th><th>Description</th><th>Stock</th><th>Price</th><th>Threshold</th><th>Actions</th></tr></thead>
-      <tbody>{rows}</tbody>
-    </table>
-    """
-    return render_template_string(BASE_HTML, body=body)
+    return render_template(PRODUCTS_TEMPLATE, products=products)
 
 @app.route('/products/add', methods=['GET', 'POST'])
 def add_product():
@@ -212,21 +439,7 @@ def add_product():
             db.session.rollback()
             flash("SKU must be unique. Choose a different SKU.")
             return redirect(url_for('add_product'))
-    body = f"""
-    <h3>Add Product</h3>
-    <form method="post">
-      <div class="mb-3"><label class="form-label">SKU</label><input class="form-control" name="sku" required></div>
-      <div class="mb-3"><label class="form-label">Name</label><input class="form-control" name="name" required></div>
-      <div class="mb-3"><label class="form-label">Description</label><textarea class="form-control" name="description"></textarea></div>
-      <div class="row">
-        <div class="col"><label class="form-label">Price</label><input class="form-control" name="price" type="number" step="0.01" value="0.00" required></div>
-        <div class="col"><label class="form-label">Stock</label><input class="form-control" name="stock" type="number" value="0" required></div>
-        <div class="col"><label class="form-label">Reorder threshold</label><input class="form-control" name="reorder_threshold" type="number" value="5" required></div>
-      </div>
-      <div class="mt-3"><button class="btn btn-success" type="submit">Save</button><a class="btn btn-secondary" href="{url_for('list_products')}">Cancel</a></div>
-    </form>
-    """
-    return render_template_string(BASE_HTML, body=body)
+    return render_template(ADD_PRODUCT_TEMPLATE)
 
 @app.route('/products/<int:product_id>/edit', methods=['GET', 'POST'])
 def edit_product(product_id):
@@ -246,192 +459,155 @@ def edit_product(product_id):
             db.session.rollback()
             flash("SKU must be unique.")
             return redirect(url_for('edit_product', product_id=product_id))
-    body = f"""
-    <h3>Edit Product</h3>
-    <form method="post">
-      <div class="mb-3"><label class="form-label">SKU</label><input class="form-control" name="sku" value="{p.sku}" required></div>
-      <div class="mb-3"><label class="form-label">Name</label><input class="form-control" name="name" value="{p.name}" required></div>
-      <div class="mb-3"><label class="form-label">Description</label><textarea class="form-control" name="description">{p.description or ''}</textarea></div>
-      <div class="row">
-        <div class="col"><label class="form-label">Price</label><input class="form-control" name="price" type="number" step="0.01" value="{p.price}" required></div>
-        <div class="col"><label class="form-label">Stock</label><input class="form-control" name="stock" type="number" value="{p.stock}" required></div>
-        <div class="col"><label class="form-label">Reorder threshold</label><input class="form-control" name="reorder_threshold" type="number" value="{p.reorder_threshold}" required></div>
-      </div>
-      <div class="mt-3"><button class="btn btn-success" type="submit">Save</button><a class="btn btn-secondary" href="{url_for('list_products')}">Cancel</a></div>
-    </form>
-    """
-    return render_template_string(BASE_HTML, body=body)
+    return render_template(EDIT_PRODUCT_TEMPLATE, p=p)
 
 @app.route('/products/<int:product_id>/delete')
 def delete_product(product_id):
-    p = Product.query.get_or_404(product_id)
-    db.session.delete(p)
+    deleted = Product.query.filter_by(id=product_id).delete(synchronize_session=False)
+    if deleted == 0:
+        abort(404)
     db.session.commit()
     flash("Product deleted.")
     return redirect(url_for('list_products'))
 
 @app.route('/products/<int:product_id>/adjust', methods=['GET', 'POST'])
 def adjust_stock(product_id):
-    p = Product.query.get_or_404(product_id)
     if request.method == 'POST':
         adj = int(request.form.get('adjust') or 0)
         reason = request.form.get('reason') or ''
-        p.stock = max(0, p.stock + adj)
+        # Single atomic UPDATE clamped at zero, no read-modify-write
+        updated = Product.query.filter_by(id=product_id).update(
+            {Product.stock: func.max(0, Product.stock + adj)}, synchronize_session=False)
+        if updated == 0:
+            abort(404)
         db.session.commit()
         flash(f"Stock adjusted by {adj}. Reason: {reason}")
         return redirect(url_for('list_products'))
-    body = f"""
-    <h3>Adjust Stock for {p.name} ({p.sku})</h3>
-    <form method="post">
-      <div class="mb-3"><label class="form-label">Current stock: <strong>{p.stock}</strong></label></div>
-      <div class="mb-3"><label class="form-label">Adjust by (negative to subtract)</label><input class="form-control" name="adjust" type="number" value="0" required></div>
-      <div class="mb-3"><label class="form-label">Reason</label><input class="form-control" name="reason"></div>
-      <div><button class="btn btn-success" type="submit">Apply</button><a class="btn btn-secondary" href="{url_for('list_products')}">Cancel</a></div>
-    </form>
-    """
-    return render_template_string(BASE_HTML, body=body)
+    p = Product.query.get_or_404(product_id)
+    return render_template(ADJUST_STOCK_TEMPLATE, p=p)
 
 @app.route('/low-stock')
 def low_stock():
-    items = Product.query.filter(Product.stock <= Product.reorder_threshold).order_by(Product.stock.asc()).all()
-    rows = "".join([f"""
-        <tr>
-          <td>{p.sku}</td>
-          <td>{p.name}</td>
-          <td>{p.stock}</td>
-          <td>{p.reorder_threshold}</td>
-          <td>
-            <a class="btn btn-sm btn-success" href="{url_for('adjust_stock', product_id=p.id)}">Adjust</a>
-            <a class="btn btn-sm btn-secondary" href="{url_for('edit_product', product_id=p.id)}">Edit</a>
-          </td>
-        </tr>
-        """ for p in items]) or "<tr><td colspan='5'>No low-stock items</td></tr>"
-    body = f"""
-    <div class="d-flex justify-content-between mb-3">
-      <h3>Low-stock items</h3><a class="btn btn-outline-primary" href="{url_for('index')}">Back</a>
-    </div>
-    <table class="table table-bordered">
-      <thead><tr><th>SKU</th><th>Name</th><th>Stock</th><th>Threshold</th><th>Actions</th></tr></thead>
-      <tbody>{rows}</tbody>
-    </table>
-    """
-    return render_template_string(BASE_HTML, body=body)
+    # Only the displayed columns; all of them live in ix_product_low_cov
+    items = db.session.query(
+        Product.id, Product.sku, Product.name, Product.stock, Product.reorder_threshold
+    ).filter(Product.stock <= Product.reorder_threshold).order_by(Product.stock.asc()).all()
+    return render_template(LOW_STOCK_TEMPLATE, items=items)
 
 # ----------------------
 # CSV Export with Comparison
 # ----------------------
-LAST_CSV_PATH = "last_inventory.csv"
+EXPORT_DIGEST_KEY = "last_export_digest"
 
 
 @app.route("/export_csv")
 def export_csv():
-    """Generate a new CSV safely and compare with last export."""
-    products = Product.query.all()
-    csv_filename = "inventory.csv"
-    temp_filename = "inventory_temp.csv"
-
-    # ✅ Write to a temporary file first
-    with open(temp_filename, mode="w", newline="") as file:
-        writer = csv.writer(file)
+    """Stream the inventory as CSV and compare its digest with the last export."""
+    def generate():
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        digest = hashlib.blake2b()
+
         writer.writerow(["SKU", "Name", "Stock", "Price"])
-        for p in products:
-            writer.writerow([p.sku, p.name, p.stock, p.price])
-
-    # ✅ Replace old file safely, handle if open in Excel
-    try:
-        os.replace(temp_filename, csv_filename)
-    except PermissionError:
-        os.remove(temp_filename)  # clean temp file
-        return """
-        <h3>⚠️ Cannot update CSV</h3>
-        <p>The file might be open in Excel or another program.<br>
-        Please close it and try again.</p>
-        <a class="btn btn-secondary" href="/">🔙 Back</a>
-        """
-
-    # ✅ Compare with last export
-    comparison_result = ""
-    if os.path.exists(LAST_CSV_PATH):
-        with open(LAST_CSV_PATH, "r") as old_file:
-            old_csv = old_file.read()
-        with open(csv_filename, "r") as new_file:
-            new_csv = new_file.read()
-
-        if new_csv == old_csv:
-            comparison_result = "✅ No changes since last export."
+        # Fixed order so the CSV and its digest don't depend on which index the planner picks
+        rows = db.session.query(Product.sku, Product.name, Product.stock, Product.price) \
+            .order_by(Product.id).yield_per(1000)
+        for sku, name, stock, price in rows:
+            writer.writerow([sku, name, stock, price])
+            if buffer.tell() >= 64 * 1024:
+                chunk = buffer.getvalue()
+                digest.update(chunk.encode("utf-8"))
+                yield chunk
+                buffer.seek(0)
+                buffer.truncate()
+        chunk = buffer.getvalue()
+        digest.update(chunk.encode("utf-8"))
+        yield chunk
+
+        # ✅ Compare with last export using the stored digest only
+        new_digest = digest.hexdigest()
+        last = db.session.get(Meta, EXPORT_DIGEST_KEY)
+
+        # ✅ Save as reference for next time (only written when it changed)
+        if last is None:
+            app.logger.info("First CSV export created.")
+            db.session.add(Meta(key=EXPORT_DIGEST_KEY, value=new_digest))
+            db.session.commit()
+        elif last.value == new_digest:
+            app.logger.info("No changes since last export.")
         else:
-            comparison_result = "🔄 Changes detected! (CSV updated)"
-    else:
-        comparison_result = "✅ First CSV export created!"
-
-    # ✅ Save as reference for next time
-    with open(LAST_CSV_PATH, "w") as last_file:
-        last_file.write(open(csv_filename).read())
+            app.logger.info("Changes detected since last export.")
+            last.value = new_digest
+            db.session.commit()
 
-    return f"""
-    <h3>CSV Exported Successfully!</h3>
-    <p>{comparison_result}</p>
-    <a class="btn btn-primary" href="/download_latest_csv">📥 Download CSV</a>
-    <a class="btn btn-secondary" href="/">🏠 Back to Dashboard</a>
-    """
+    response = Response(stream_with_context(generate()), mimetype="text/csv")
+    response.headers["Content-Disposition"] = "attachment; filename=inventory.csv"
+    return response
 
 # =======================
 # DOWNLOAD LATEST CSV
 # =======================
 
+def latest_exports(export_dir, count=2):
+    """Return the newest `count` CSV names in export_dir (newest first) without sorting the whole folder."""
+    with os.scandir(export_dir) as entries:
+        return heapq.nlargest(count, (e.name for e in entries if e.name.endswith(".csv")))
+
 @app.route("/download_latest_csv")
 def download_latest_csv():
     export_dir = os.path.join(os.getcwd(), "exports")
     os.makedirs(export_dir, exist_ok=True)
 
-    csv_files = sorted(
-        [f for f in os.listdir(export_dir) if f.endswith(".csv")],
-        reverse=True
+    csv_files = latest_exports(export_dir)
+
+    columns = ["SKU", "Name", "Stock", "Price"]
+
+    def read_export(index):
+        if len(csv_files) > index:
+            # Files in exports/ aren't written by this app, so read the first four columns
+            # by position and ignore header spelling and stray extra fields
+            try:
+                data = pd.read_csv(os.path.join(export_dir, csv_files[index]), header=0, names=columns,
+                                   usecols=range(len(columns)), index_col=False,
+                                   dtype=str, keep_default_na=False)
+                return data.fillna("").drop_duplicates("SKU")
+            except (pd.errors.EmptyDataError, ValueError):
+                pass  # zero-byte or unreadable export, treat like a missing one
+        return pd.DataFrame(columns=columns, dtype=str)
+
+    current_data = read_export(0)
+    previous_data = read_export(1)
+
+    # Match rows by SKU so reordered exports still compare correctly
+    merged = previous_data.merge(current_data, on="SKU", how="outer",
+                                 suffixes=("_prev", "_curr"), indicator=True)
+    in_prev = merged["_merge"] != "right_only"
+    in_curr = merged["_merge"] != "left_only"
+    merged = merged.fillna("")
+
+    changed = (merged["Stock_prev"] != merged["Stock_curr"]) | (merged["Price_prev"] != merged["Price_curr"])
+    updated = merged["Name_prev"] != merged["Name_curr"]
+    status = np.select(
+        [~in_curr, ~in_prev, changed, updated],
+        ["REMOVED", "NEW", "CHANGED", "UPDATED"],
+        default="UNCHANGED",
     )
 
-    current_data = []
-    previous_data = []
-
-    if len(csv_files) > 0:
-        with open(os.path.join(export_dir, csv_files[0]), newline="", encoding="utf-8") as file:
-            reader = csv.reader(file)
-            current_data = list(reader)
-
-    if len(csv_files) > 1:
-        with open(os.path.join(export_dir, csv_files[1]), newline="", encoding="utf-8") as file:
-            reader = csv.reader(file)
-            previous_data = list(reader)
+    comparison = pd.DataFrame({
+        "Previous SKU": np.where(in_prev, merged["SKU"], ""),
+        "Previous Name": merged["Name_prev"],
+        "Previous Stock": merged["Stock_prev"],
+        "Previous Price": merged["Price_prev"],
+        "Current SKU": np.where(in_curr, merged["SKU"], ""),
+        "Current Name": merged["Name_curr"],
+        "Current Stock": merged["Stock_curr"],
+        "Current Price": merged["Price_curr"],
+        "Status": status,
+    })
 
     # Build comparison CSV in memory
     output = StringIO()
-    writer = csv.writer(output)
-
-    writer.writerow([
-        "Previous SKU", "Previous Name", "Previous Stock", "Previous Price",
-        "Current SKU", "Current Name", "Current Stock", "Current Price",
-        "Status"
-    ])
-
-    max_rows = max(len(previous_data), len(current_data))
-    for i in range(max_rows):
-        prev_row = previous_data[i] if i < len(previous_data) else ["", "", "", ""]
-        curr_row = current_data[i] if i < len(current_data) else ["", "", "", ""]
-
-        status = ""
-        if prev_row and curr_row and len(prev_row) >= 4 and len(curr_row) >= 4:
-            if prev_row != curr_row:
-                if prev_row[2] != curr_row[2] or prev_row[3] != curr_row[3]:
-                    status = "CHANGED"
-                else:
-                    status = "UPDATED"
-            else:
-                status = "UNCHANGED"
-        elif any(curr_row):
-            status = "NEW"
-        elif any(prev_row):
-            status = "REMOVED"
-
-        writer.writerow(prev_row + curr_row + [status])
+    comparison.to_csv(output, index=False)
 
     response = Response(output.getvalue(), mimetype="text/csv")
     response.headers["Content-Disposition"] = "attachment; filename=compare_inventory.csv"
@@ -443,10 +619,7 @@ def compare_csv():
     export_dir = os.path.join(os.getcwd(), "exports")
     os.makedirs(export_dir, exist_ok=True)
 
-    csv_files = sorted(
-        [f for f in os.listdir(export_dir) if f.endswith(".csv")],
-        reverse=True
-    )
+    csv_files = latest_exports(export_dir)
 
     # Load latest (current) CSV
     current_data = []